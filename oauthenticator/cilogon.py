@@ -1,18 +1,85 @@
 """
 A JupyterHub authenticator class for use with CILogon as an identity provider.
 """
+import json
 import os
-from urllib.parse import urlparse
+from importlib import resources
 
 import jsonschema
 from jupyterhub.auth import LocalAuthenticator
-from ruamel.yaml import YAML
 from tornado import web
-from traitlets import Bool, Dict, List, Unicode, default, validate
+from traitlets import Bool, Dict, List, Unicode, default, observe, validate
 
 from .oauth2 import OAuthenticator, OAuthLoginHandler
 
-yaml = YAML(typ="safe", pure=True)
+# The JSONSchema validating entries in allowed_idps is static, so load it once
+# at import time instead of re-reading and re-parsing it for every idp. It is
+# read as a package resource, which also works from zip imports.
+if hasattr(resources, "files"):
+    _schema_text = (
+        resources.files("oauthenticator.schemas")
+        .joinpath("cilogon-schema.json")
+        .read_text()
+    )
+else:
+    # importlib.resources.files is only available in Python 3.9+
+    _schema_text = resources.read_text("oauthenticator.schemas", "cilogon-schema.json")
+_IDP_CONFIG_SCHEMA = json.loads(_schema_text)
+
+# jsonschema.validate re-compiles the schema on every call, so compile a
+# validator once up front. The schema is wrapped so the whole allowed_idps
+# dict is validated in a single pass rather than once per idp, with each
+# value checked against the idp config schema.
+jsonschema.Draft7Validator.check_schema(_IDP_CONFIG_SCHEMA)
+_ALLOWED_IDPS_VALIDATOR = jsonschema.Draft7Validator(
+    {"type": "object", "additionalProperties": _IDP_CONFIG_SCHEMA}
+)
+
+
+class _IdpRecord:
+    """
+    Pre-resolved username derivation config for one entry in allowed_idps,
+    built once when allowed_idps is validated so the per-login code paths
+    don't have to re-index nested config dicts.
+    """
+
+    __slots__ = ("username_claim", "derive_username", "allowed_domains")
+
+    def __init__(self, idp_config):
+        username_derivation = idp_config["username_derivation"]
+        self.username_claim = username_derivation["username_claim"]
+
+        # normalized once so the per-login membership check is O(1) and
+        # doesn't need to lowercase configured domains
+        allowed_domains = idp_config.get("allowed_domains")
+        if allowed_domains:
+            allowed_domains = frozenset(domain.lower() for domain in allowed_domains)
+        self.allowed_domains = allowed_domains
+
+        action = username_derivation.get("action")
+        if action == "strip_idp_domain":
+            domain_suffix = ("@" + username_derivation["domain"]).lower()
+            suffix_len = len(domain_suffix)
+
+            def derive_username(username):
+                # only lowercase the tail instead of the whole username, a
+                # username shorter than the suffix never compares equal
+                if username[-suffix_len:].lower() == domain_suffix:
+                    username = username[:-suffix_len]
+                return username
+
+        elif action == "prefix":
+            prefix = username_derivation["prefix"]
+
+            def derive_username(username):
+                return f"{prefix}:{username}"
+
+        else:
+
+            def derive_username(username):
+                return username
+
+        self.derive_username = derive_username
 
 
 class CILogonLoginHandler(OAuthLoginHandler):
@@ -26,15 +93,10 @@ class CILogonLoginHandler(OAuthLoginHandler):
         Related documentation at https://www.cilogon.org/oidc#h.p_IWGvXH0okDI_.
         """
         # kwargs is updated to include extra_params if it doesn't already
-        # include it, we then modify kwargs' extra_params dictionary
+        # include it, we then update kwargs' extra_params dictionary with the
+        # params precomputed from config by the authenticator
         extra_params = kwargs.setdefault('extra_params', {})
-
-        # selected_idp should be a comma separated string
-        allowed_idps = ",".join(self.authenticator.allowed_idps.keys())
-        extra_params["selected_idp"] = allowed_idps
-
-        if self.authenticator.skin:
-            extra_params["skin"] = self.authenticator.skin
+        extra_params.update(self.authenticator._authorize_extra_params)
 
         return super().authorize_redirect(*args, **kwargs)
 
@@ -175,19 +237,13 @@ class CILogonOAuthenticator(OAuthenticator):
         if not idps:
             raise ValueError("One or more allowed_idps must be configured")
 
-        for entity_id, idp_config in idps.items():
-            # Validate `idp_config` config using the schema
-            root_dir = os.path.dirname(os.path.abspath(__file__))
-            schema_file = os.path.join(root_dir, "schemas", "cilogon-schema.yaml")
-            with open(schema_file) as schema_fd:
-                schema = yaml.load(schema_fd)
-                # Raises useful exception if validation fails
-                jsonschema.validate(idp_config, schema)
+        # Validate all idp configs against the schema in one pass
+        # Raises useful exception if validation fails
+        _ALLOWED_IDPS_VALIDATOR.validate(idps)
 
+        for entity_id in idps:
             # Make sure allowed_idps contains EntityIDs and not domain names.
-            accepted_entity_id_scheme = ["urn", "https", "http"]
-            entity_id_scheme = urlparse(entity_id).scheme
-            if entity_id_scheme not in accepted_entity_id_scheme:
+            if not entity_id.startswith(("urn:", "https://", "http://")):
                 # Validate entity ids are the form of: `https://github.com/login/oauth/authorize`
                 self.log.error(
                     f"Trying to allow an auth provider: {entity_id}, that doesn't look like a valid CILogon EntityID.",
@@ -197,6 +253,23 @@ class CILogonOAuthenticator(OAuthenticator):
                     "See https://cilogon.org/idplist for the list of EntityIDs of each IDP."
                 )
 
+        # Pre-resolve each idp's username derivation config once, the login hot
+        # paths then use these records instead of re-indexing nested dicts.
+        self._idp_records = {
+            entity_id: _IdpRecord(idp_config) for entity_id, idp_config in idps.items()
+        }
+
+        # selected_idp should be a comma separated string, built here once
+        # instead of on every login redirect
+        self._selected_idps = ",".join(idps.keys())
+        self._rebuild_authorize_extra_params()
+
+        # lets check_allowed skip the auth_model lookups entirely when no idp
+        # configures allowed_domains
+        self._has_allowed_domains = any(
+            record.allowed_domains for record in self._idp_records.values()
+        )
+
         return idps
 
     skin = Unicode(
@@ -209,6 +282,29 @@ class CILogonOAuthenticator(OAuthenticator):
         """,
     )
 
+    # attributes populated by _validate_allowed_idps, the class level defaults
+    # cover authenticators whose allowed_idps was never configured and are
+    # replaced, never mutated
+    _idp_records = {}
+    _has_allowed_domains = False
+
+    # extra params sent by CILogonLoginHandler.authorize_redirect, derived
+    # entirely from config so they are rebuilt when allowed_idps or skin
+    # change rather than on every login redirect, the class level defaults
+    # are replaced, never mutated
+    _selected_idps = ""
+    _authorize_extra_params = {"selected_idp": ""}
+
+    def _rebuild_authorize_extra_params(self):
+        extra_params = {"selected_idp": self._selected_idps}
+        if self.skin:
+            extra_params["skin"] = self.skin
+        self._authorize_extra_params = extra_params
+
+    @observe("skin")
+    def _observe_skin(self, change):
+        self._rebuild_authorize_extra_params()
+
     # _deprecated_oauth_aliases is used by deprecation logic in OAuthenticator
     _deprecated_oauth_aliases = {
         "idp_whitelist": ("allowed_idps", "0.12.0", False),
@@ -287,7 +383,9 @@ class CILogonOAuthenticator(OAuthenticator):
             message = "'idp' claim was not part of the response to the userdata_url"
             self.log.error(message)
             raise web.HTTPError(500, message)
-        if not self.allowed_idps.get(user_idp):
+        # _idp_records mirrors allowed_idps' keys and is a plain attribute,
+        # cheaper to read here than the trait
+        if user_idp not in self._idp_records:
             message = f"Login with identity provider {user_idp} is not pre-configured"
             self.log.error(message)
             raise web.HTTPError(403, message)
@@ -295,6 +393,10 @@ class CILogonOAuthenticator(OAuthenticator):
         unprocessed_username = self._user_info_to_unprocessed_username(user_info)
         username = self._get_processed_username(unprocessed_username, user_info)
 
+        # stashed temporarily for build_auth_state_dict to pop, so the auth
+        # pipeline derives the unprocessed username only once per login
+        user_info["_unprocessed_username"] = unprocessed_username
+
         return username
 
     def _user_info_to_unprocessed_username(self, user_info):
@@ -303,8 +405,7 @@ class CILogonOAuthenticator(OAuthenticator):
         specified under "username_derivation" for the associated idp.
         """
         user_idp = user_info["idp"]
-        username_derivation = self.allowed_idps[user_idp]["username_derivation"]
-        username_claim = username_derivation["username_claim"]
+        username_claim = self._idp_records[user_idp].username_claim
 
         username = user_info.get(username_claim)
         if not username:
@@ -320,19 +421,25 @@ class CILogonOAuthenticator(OAuthenticator):
         specified under "username_derivation" for the associated idp.
         """
         user_idp = user_info["idp"]
-        username_derivation = self.allowed_idps[user_idp]["username_derivation"]
 
         # Optionally execute action "strip_idp_domain" or "prefix"
-        action = username_derivation.get("action")
-        if action == "strip_idp_domain":
-            domain_suffix = "@" + username_derivation["domain"]
-            if username.lower().endswith(domain_suffix.lower()):
-                username = username[: -len(domain_suffix)]
-        elif action == "prefix":
-            prefix = username_derivation["prefix"]
-            username = f"{prefix}:{username}"
+        return self._idp_records[user_idp].derive_username(username)
 
-        return username
+    def build_auth_state_dict(self, token_info, user_info):
+        """
+        Overrides OAuthenticator.build_auth_state_dict to also include the
+        username before the idp's username_derivation action was applied, so
+        check_allowed doesn't have to derive it from user_info again.
+
+        The value was stashed in user_info by user_info_to_username and is
+        popped back out here, leaving the stored user model unchanged.
+        """
+        auth_state = super().build_auth_state_dict(token_info, user_info)
+        unprocessed_username = user_info.pop("_unprocessed_username", None)
+        if unprocessed_username is None:
+            unprocessed_username = self._user_info_to_unprocessed_username(user_info)
+        auth_state["unprocessed_username"] = unprocessed_username
+        return auth_state
 
     async def check_allowed(self, username, auth_model):
         """
@@ -342,11 +449,20 @@ class CILogonOAuthenticator(OAuthenticator):
         if await super().check_allowed(username, auth_model):
             return True
 
-        user_info = auth_model["auth_state"][self.user_auth_state_key]
+        # nothing more to check when no idp configures allowed_domains
+        if not self._has_allowed_domains:
+            return False
+
+        auth_state = auth_model["auth_state"]
+        user_info = auth_state[self.user_auth_state_key]
         user_idp = user_info["idp"]
-        idp_allowed_domains = self.allowed_idps[user_idp].get("allowed_domains")
+        idp_allowed_domains = self._idp_records[user_idp].allowed_domains
         if idp_allowed_domains:
-            unprocessed_username = self._user_info_to_unprocessed_username(user_info)
+            # fall back to deriving the username again for auth state built
+            # before the unprocessed_username key was introduced
+            unprocessed_username = auth_state.get(
+                "unprocessed_username"
+            ) or self._user_info_to_unprocessed_username(user_info)
             user_domain = unprocessed_username.split("@", 1)[1].lower()
             if user_domain in idp_allowed_domains:
                 return True
@@ -2,15 +2,31 @@
 A JupyterHub authenticator class for use with any OAuth2 based identity provider.
 """
 import os
-from functools import reduce
 
 from jupyterhub.auth import LocalAuthenticator
 from jupyterhub.traitlets import Callable
 from tornado.httpclient import AsyncHTTPClient
-from traitlets import Bool, Dict, Set, Unicode, Union, default
+from traitlets import Any, Bool, Dict, Set, Unicode, Union, default, observe
 
 from .oauth2 import OAuthenticator
 
+# HTTP clients shared across authenticator instances, keyed on the
+# validate_cert default they were created with. Sharing a client lets token
+# and userdata requests reuse kept-alive connections instead of paying a new
+# TCP+TLS handshake, and max_clients bounds the concurrent requests.
+_http_clients = {}
+
+
+def _shared_http_client(validate_cert):
+    client = _http_clients.get(validate_cert)
+    if client is None:
+        client = _http_clients[validate_cert] = AsyncHTTPClient(
+            force_instance=True,
+            max_clients=100,
+            defaults=dict(validate_cert=validate_cert),
+        )
+    return client
+
 
 class GenericOAuthenticator(OAuthenticator):
     @default("login_service")
@@ -28,6 +44,24 @@ class GenericOAuthenticator(OAuthenticator):
         """,
     )
 
+    # the dotted key path in claim_groups_key is fixed config, so split it once
+    # instead of on every get_user_groups call, None when claim_groups_key is
+    # a callable
+    _claim_groups_path = Any()
+
+    @default("_claim_groups_path")
+    def _claim_groups_path_default(self):
+        if callable(self.claim_groups_key):
+            return None
+        return tuple(self.claim_groups_key.split("."))
+
+    @observe("claim_groups_key")
+    def _update_claim_groups_path(self, change):
+        if callable(change.new):
+            self._claim_groups_path = None
+        else:
+            self._claim_groups_path = tuple(change.new.split("."))
+
     allowed_groups = Set(
         Unicode(),
         config=True,
@@ -70,11 +104,28 @@ class GenericOAuthenticator(OAuthenticator):
         """,
     )
 
+    # username_claim is either a claim key or a callable, decide which once at
+    # config time instead of testing callable() on every login
+    _username_resolver = Any()
+
+    @default("_username_resolver")
+    def _username_resolver_default(self):
+        return self._make_username_resolver(self.username_claim)
+
+    @observe("username_claim")
+    def _update_username_resolver(self, change):
+        self._username_resolver = self._make_username_resolver(change.new)
+
+    def _make_username_resolver(self, username_claim):
+        if callable(username_claim):
+            return username_claim
+        # the base class implementation reads username_claim and raises a
+        # helpful error when the claim is missing from the response
+        return super().user_info_to_username
+
     @default("http_client")
     def _default_http_client(self):
-        return AsyncHTTPClient(
-            force_instance=True, defaults=dict(validate_cert=self.validate_server_cert)
-        )
+        return _shared_http_client(self.validate_server_cert)
 
     # _deprecated_oauth_aliases is used by deprecation logic in OAuthenticator
     _deprecated_oauth_aliases = {
@@ -113,12 +164,10 @@ class GenericOAuthenticator(OAuthenticator):
         """
         Overrides OAuthenticator.user_info_to_username to support the
         GenericOAuthenticator unique feature of allowing username_claim to be a
-        callable function.
+        callable function, resolved to either the callable or the base class
+        implementation once at config time.
         """
-        if callable(self.username_claim):
-            return self.username_claim(user_info)
-        else:
-            return super().user_info_to_username(user_info)
+        return self._username_resolver(user_info)
 
     def get_user_groups(self, user_info):
         """
@@ -134,15 +183,26 @@ class GenericOAuthenticator(OAuthenticator):
         Note that this method is introduced by GenericOAuthenticator and not
         present in the base class.
         """
-        if callable(self.claim_groups_key):
-            return set(self.claim_groups_key(user_info))
-        try:
-            return set(reduce(dict.get, self.claim_groups_key.split("."), user_info))
-        except TypeError:
-            self.log.error(
-                f"The claim_groups_key {self.claim_groups_key} does not exist in the user token"
-            )
-            return set()
+        claim_groups_key = self.claim_groups_key
+        if callable(claim_groups_key):
+            return set(claim_groups_key(user_info))
+
+        groups = user_info
+        for key in self._claim_groups_path:
+            if not isinstance(groups, dict):
+                groups = None
+                break
+            groups = groups.get(key)
+        if groups is not None:
+            try:
+                return set(groups)
+            except TypeError:
+                # the claim resolved to a non-iterable value
+                pass
+        self.log.error(
+            f"The claim_groups_key {claim_groups_key} does not exist in the user token"
+        )
+        return set()
 
     async def update_auth_model(self, auth_model):
         """
@@ -159,7 +219,9 @@ class GenericOAuthenticator(OAuthenticator):
             # admin status should in this case be True or False, not None
             user_info = auth_model["auth_state"][self.user_auth_state_key]
             user_groups = self.get_user_groups(user_info)
-            auth_model["admin"] = bool(user_groups & self.admin_groups)
+            # isdisjoint stops at the first shared group without building an
+            # intersection set
+            auth_model["admin"] = not user_groups.isdisjoint(self.admin_groups)
 
         return auth_model
 
@@ -171,13 +233,15 @@ class GenericOAuthenticator(OAuthenticator):
         if await super().check_allowed(username, auth_model):
             return True
 
-        if self.allowed_groups:
-            user_info = auth_model["auth_state"][self.user_auth_state_key]
-            user_groups = self.get_user_groups(user_info)
-            if any(user_groups & self.allowed_groups):
-                return True
-
         # users should be explicitly allowed via config, otherwise they aren't
+        if not self.allowed_groups:
+            return False
+
+        user_info = auth_model["auth_state"][self.user_auth_state_key]
+        user_groups = self.get_user_groups(user_info)
+        if not user_groups.isdisjoint(self.allowed_groups):
+            return True
+
         return False
 
 
@@ -3,6 +3,7 @@ Base classes for use by OAuth2 based JupyterHub authenticator classes.
 
 Founded based on work by Kyle Kelley (@rgbkrk)
 """
+import asyncio
 import base64
 import json
 import os
@@ -18,7 +19,7 @@ from tornado.auth import OAuth2Mixin
 from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
 from tornado.httputil import url_concat
 from tornado.log import app_log
-from traitlets import Any, Bool, Dict, List, Unicode, default
+from traitlets import Any, Bool, Dict, Int, List, Unicode, default
 
 
 def guess_callback_uri(protocol, host, hub_server_url):
@@ -575,6 +576,15 @@ class OAuthenticator(Authenticator):
         """,
     )
 
+    concurrent_userdata_requests = Int(
+        10,
+        config=True,
+        help="""
+        Maximum number of concurrent requests to :attr:`userdata_url` made by
+        :meth:`bulk_token_to_user`.
+        """,
+    )
+
     http_client = Any()
 
     @default("http_client")
@@ -878,6 +888,33 @@ class OAuthenticator(Authenticator):
             validate_cert=self.validate_server_cert,
         )
 
+    async def bulk_token_to_user(self, token_info_list):
+        """
+        Fetches user info for several users' token_info dicts concurrently.
+
+        Requests are made through the shared `http_client`, with at most
+        :attr:`concurrent_userdata_requests` in flight at a time, so that
+        refreshing auth for many users doesn't pay one serial round-trip to
+        :attr:`userdata_url` per user.
+
+        Args:
+            token_info_list: an iterable of token_info dicts, as accepted by
+                :meth:`token_to_user`
+
+        Returns:
+            a list with :meth:`token_to_user`'s response for each entry in
+            token_info_list, in the same order
+        """
+        semaphore = asyncio.Semaphore(self.concurrent_userdata_requests)
+
+        async def bounded_token_to_user(token_info):
+            async with semaphore:
+                return await self.token_to_user(token_info)
+
+        return await asyncio.gather(
+            *(bounded_token_to_user(token_info) for token_info in token_info_list)
+        )
+
     def build_auth_state_dict(self, token_info, user_info):
         """
         Builds the `auth_state` dict that will be returned by a succesfull `authenticate` method call.
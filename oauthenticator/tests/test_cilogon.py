@@ -456,3 +456,26 @@ async def test_allowed_domains_no_stripping(cilogon_client):
     )
     auth_model = await authenticator.get_authenticated_user(handler, None)
     assert auth_model['name'] == 'jtkirk@pink.org'
+
+
+async def test_allowed_domains_mixed_case(cilogon_client):
+    c = Config()
+    c.CILogonOAuthenticator.allowed_idps = {
+        'https://some-idp.com/login/oauth/authorize': {
+            'username_derivation': {
+                'username_claim': 'email',
+            },
+            'allowed_domains': ['Pink.ORG'],
+        },
+    }
+
+    authenticator = CILogonOAuthenticator(config=c)
+
+    # Test login with a domain matching a configured domain except for casing
+    handler = cilogon_client.handler_for_user(
+        user_model(
+            'jtkirk@PINK.org', 'email', idp='https://some-idp.com/login/oauth/authorize'
+        )
+    )
+    auth_model = await authenticator.get_authenticated_user(handler, None)
+    assert auth_model['name'] == 'jtkirk@pink.org'
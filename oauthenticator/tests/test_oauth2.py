@@ -1,3 +1,4 @@
+import asyncio
 import re
 import uuid
 from unittest.mock import Mock, PropertyMock
@@ -70,6 +71,33 @@ async def test_httpfetch(client):
     assert r == ['http://example.org/a', 'GET', "proxy.example.org", 8080]
 
 
+async def test_bulk_token_to_user():
+    c = Config()
+    c.OAuthenticator.concurrent_userdata_requests = 3
+    authenticator = OAuthenticator(config=c)
+
+    in_flight = 0
+    peak_in_flight = 0
+
+    async def mock_token_to_user(token_info):
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return {"sub": token_info["access_token"]}
+
+    authenticator.token_to_user = mock_token_to_user
+
+    token_info_list = [{"access_token": f"token-{i}"} for i in range(10)]
+    user_infos = await authenticator.bulk_token_to_user(token_info_list)
+
+    # assert that the responses come back in input order, and that no more
+    # than concurrent_userdata_requests requests were in flight at a time
+    assert user_infos == [{"sub": f"token-{i}"} for i in range(10)]
+    assert peak_in_flight == 3
+
+
 @mark.parametrize(
     "test_variation_id,class_config",
     [